@@ -0,0 +1,33 @@
+# SMART 10-year recurrent CVD risk kernel.
+# Kept out of the Streamlit script so the ufuncs are built once per process on import,
+# rather than re-decorated on every rerun; cache=True persists the machine code in
+# __pycache__ so a cold start loads it instead of recompiling.
+import math
+
+from numba import float64, int64, njit, vectorize
+
+# Linear-predictor coefficients: age, sex, SBP, TC, HDL, smoking, diabetes, eGFR/10, log(CRP+1), vascular beds
+SMART_COEF = (0.064, 0.34, 0.02, 0.25, -0.25, 0.44, 0.51, -0.2, 0.25, 0.4)
+# log of the 10-year baseline survival (0.900), so 0.900**x == exp(_LOG_SURV * x)
+_LOG_SURV = math.log(0.900)
+
+@njit(cache=True)
+def _smart_risk(age, sex_val, sbp, total_chol, hdl, smoking_val, diabetes_val, egfr, crp, vasc_count):
+    c_age, c_sex, c_sbp, c_tc, c_hdl, c_smk, c_dm, c_egfr, c_crp, c_vasc = SMART_COEF
+    lp = (c_age*age + c_sex*sex_val + c_sbp*sbp + c_tc*total_chol +
+          c_hdl*hdl + c_smk*smoking_val + c_dm*diabetes_val +
+          c_egfr*(egfr/10) + c_crp*math.log1p(crp) + c_vasc*vasc_count)
+    return 1 - math.exp(_LOG_SURV * math.exp(lp - 5.8))
+
+_SIGNATURE = [float64(int64, int64, float64, float64, float64, int64, int64, int64, float64, int64)]
+
+# Single-threaded ufunc used by the app: safe to call from concurrent Streamlit sessions
+@vectorize(_SIGNATURE, nopython=True, cache=True, target="cpu")
+def smart_risk(age, sex_val, sbp, total_chol, hdl, smoking_val, diabetes_val, egfr, crp, vasc_count):
+    return _smart_risk(age, sex_val, sbp, total_chol, hdl, smoking_val, diabetes_val, egfr, crp, vasc_count)
+
+# Multi-core ufunc for batch cohort scoring. Not called from the app: numba's workqueue
+# threading layer (used when TBB/OpenMP are absent) aborts on concurrent calls.
+@vectorize(_SIGNATURE, nopython=True, cache=True, target="parallel")
+def smart_risk_cohort(age, sex_val, sbp, total_chol, hdl, smoking_val, diabetes_val, egfr, crp, vasc_count):
+    return _smart_risk(age, sex_val, sbp, total_chol, hdl, smoking_val, diabetes_val, egfr, crp, vasc_count)